@@ -1,9 +1,18 @@
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Iterable, List, Optional, Set, Tuple
 
-from sqlalchemy import func
+from sqlalchemy import exists, func, insert
+from sqlalchemy.orm import load_only, selectinload
 
-from db import SessionLocal, Candidate, Election, Vote
+from db import SessionLocal, Candidate, Election, Vote, utcnow
+
+
+class VotingClosedError(ValueError):
+    """The election is outside its voting window, or the candidate is not on its ballot."""
+
+
+class AlreadyVotedError(ValueError):
+    """The voter already has a vote recorded in this election."""
 
 
 def create_election(
@@ -22,7 +31,6 @@ def create_election(
     )
     session.add(election)
     session.commit()
-    session.refresh(election)
     return election
 
 
@@ -30,13 +38,19 @@ def add_candidate(session: SessionLocal, election_id: int, name: str, party: str
     candidate = Candidate(election_id=election_id, name=name.strip(), party=party.strip())
     session.add(candidate)
     session.commit()
-    session.refresh(candidate)
     return candidate
 
 
-def list_active_elections(session: SessionLocal, include_future: bool = False) -> List[Election]:
-    now = datetime.utcnow()
+def list_active_elections(
+    session: SessionLocal,
+    include_future: bool = False,
+    with_candidates: bool = False,
+) -> List[Election]:
+    now = utcnow()
     query = session.query(Election)
+    if with_candidates:
+        # Batch-load every election's candidates in one IN query instead of one per election.
+        query = query.options(selectinload(Election.candidates))
     if include_future:
         query = query.filter(Election.end_time >= now)
     else:
@@ -45,16 +59,44 @@ def list_active_elections(session: SessionLocal, include_future: bool = False) -
 
 
 def list_all_elections(session: SessionLocal) -> List[Election]:
-    return session.query(Election).order_by(Election.start_time.desc()).all()
+    # Admin listings never show the description, so leave that TEXT column unloaded.
+    return (
+        session.query(Election)
+        .options(load_only(Election.id, Election.title, Election.start_time, Election.end_time))
+        .order_by(Election.start_time.desc())
+        .all()
+    )
 
 
 def has_user_voted(session: SessionLocal, voter_id: int, election_id: int) -> bool:
-    return (
-        session.query(Vote)
-        .filter(Vote.voter_id == voter_id, Vote.election_id == election_id)
-        .first()
-        is not None
+    return session.query(
+        exists().where(Vote.voter_id == voter_id, Vote.election_id == election_id)
+    ).scalar()
+
+
+def voted_election_ids(session: SessionLocal, voter_id: int, election_ids: Iterable[int]) -> Set[int]:
+    election_ids = list(election_ids)
+    if not election_ids:
+        return set()
+    rows = (
+        session.query(Vote.election_id)
+        .filter(Vote.voter_id == voter_id, Vote.election_id.in_(election_ids))
+        .all()
     )
+    return {election_id for (election_id,) in rows}
+
+
+def is_voting_open(session: SessionLocal, election_id: int, candidate_id: int) -> bool:
+    now = utcnow()
+    return session.query(
+        exists().where(
+            Candidate.id == candidate_id,
+            Candidate.election_id == Election.id,
+            Election.id == election_id,
+            Election.start_time <= now,
+            Election.end_time >= now,
+        )
+    ).scalar()
 
 
 def record_vote(
@@ -63,28 +105,38 @@ def record_vote(
     voter_id: int,
     election_id: int,
     candidate_id: int,
-) -> Vote:
+) -> int:
+    if not is_voting_open(session, election_id, candidate_id):
+        raise VotingClosedError("This election is not open for voting.")
     if has_user_voted(session, voter_id, election_id):
-        raise ValueError("User has already voted in this election.")
-    vote = Vote(voter_id=voter_id, election_id=election_id, candidate_id=candidate_id)
-    session.add(vote)
+        raise AlreadyVotedError("User has already voted in this election.")
+    # Core insert: no ORM instance to track and no refresh round-trip; callers only need the id.
+    result = session.execute(
+        insert(Vote).values(
+            voter_id=voter_id,
+            election_id=election_id,
+            candidate_id=candidate_id,
+        )
+    )
     session.commit()
-    session.refresh(vote)
-    return vote
+    return result.inserted_primary_key[0]
 
 
-def election_results(session: SessionLocal, election_id: int) -> List[Tuple[Candidate, int]]:
+def election_results(
+    session: SessionLocal, election_id: int
+) -> List[Tuple[int, str, Optional[str], int]]:
+    vote_count = func.count(Vote.id).label("vote_count")
     results = (
-        session.query(Candidate, func.count(Vote.id).label("vote_count"))
+        session.query(Candidate.id, Candidate.name, Candidate.party, vote_count)
         .outerjoin(Vote, Vote.candidate_id == Candidate.id)
         .filter(Candidate.election_id == election_id)
-        .group_by(Candidate.id)
-        .order_by(func.count(Vote.id).desc())
+        .group_by(Candidate.id, Candidate.name, Candidate.party)
+        .order_by(vote_count.desc(), Candidate.name)
         .all()
     )
     return results
 
 
 def get_election(session: SessionLocal, election_id: int) -> Optional[Election]:
-    return session.query(Election).filter(Election.id == election_id).first()
+    return session.get(Election, election_id)
 
@@ -1,21 +1,25 @@
 import os
 import re
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import streamlit as st
 
 from admin import (
+    AlreadyVotedError,
+    VotingClosedError,
     add_candidate,
     create_election,
     election_results,
-    has_user_voted,
     list_active_elections,
     list_all_elections,
     record_vote,
+    voted_election_ids,
 )
 from auth import (
+    LoginThrottledError,
     authenticate_user,
     can_attempt_face_verification,
     get_user_by_id,
@@ -23,15 +27,18 @@ from auth import (
     register_user,
     reset_failed_face_attempts,
 )
-from db import Candidate, Election, SessionLocal, Vote, init_db, session_scope
+from db import Candidate, Election, SessionLocal, Vote, init_db, session_scope, utcnow
 from face_utils import (
     blob_to_embedding,
+    decode_image,
     deepface_liveness_check,
     embedding_to_blob,
     generate_face_embedding,
-    perform_basic_liveness_check,
+    perform_basic_liveness_check_from_array,
     save_image_bytes,
+    save_uploaded_file,
     verify_face,
+    warm_up_face_pipeline,
 )
 
 
@@ -40,6 +47,8 @@ FACE_DIR = IMAGES_ROOT / "faces"
 ID_DIR = IMAGES_ROOT / "ids"
 ADMIN_INVITE_CODE = os.getenv("SMARTVOTE_ADMIN_CODE", "ADMIN123")
 LIVENESS_VARIANCE_THRESHOLD = 6.0
+ELECTION_CACHE_TTL_SEC = 30
+_SLUG_RE = re.compile(r"[^a-zA-Z0-9]+")
 
 
 @st.cache_resource
@@ -51,7 +60,15 @@ def _bootstrap():
     return True
 
 
+@st.cache_resource
+def _load_face_model():
+    # Build and exercise the DeepFace pipeline once per server process instead of on the first verification.
+    warm_up_face_pipeline()
+    return True
+
+
 _ = _bootstrap()
+_ = _load_face_model()
 
 st.set_page_config(page_title="SmartVote - Secure Face Verified Voting", layout="wide")
 
@@ -60,8 +77,52 @@ def get_db_session():
     return SessionLocal()
 
 
+def _election_cache_bucket() -> int:
+    # Changes every TTL window so elections that open or close drop out of the cache on time.
+    return int(time.time() // ELECTION_CACHE_TTL_SEC)
+
+
+@st.cache_data(ttl=ELECTION_CACHE_TTL_SEC, show_spinner=False)
+def _cached_active_elections(bucket: int) -> List[Dict]:
+    with session_scope() as session:
+        elections = list_active_elections(session, include_future=False, with_candidates=True)
+        return [
+            {
+                "id": election.id,
+                "title": election.title,
+                "description": election.description,
+                "start_time": election.start_time,
+                "end_time": election.end_time,
+                "candidates": [
+                    {"id": candidate.id, "name": candidate.name, "party": candidate.party}
+                    for candidate in election.candidates
+                ],
+            }
+            for election in elections
+        ]
+
+
+@st.cache_data(ttl=ELECTION_CACHE_TTL_SEC, show_spinner=False)
+def _cached_all_elections(bucket: int) -> List[Dict]:
+    with session_scope() as session:
+        return [
+            {
+                "id": election.id,
+                "title": election.title,
+                "start_time": election.start_time,
+                "end_time": election.end_time,
+            }
+            for election in list_all_elections(session)
+        ]
+
+
+def clear_election_caches():
+    _cached_active_elections.clear()
+    _cached_all_elections.clear()
+
+
 def slugify(value: str) -> str:
-    return re.sub(r"[^a-zA-Z0-9]+", "_", value).strip("_").lower()
+    return _SLUG_RE.sub("_", value).strip("_").lower()
 
 
 def snapshot_current_user() -> Optional[Dict]:
@@ -113,6 +174,8 @@ def render_login():
                 st.error("Invalid credentials.")
             else:
                 login_user(user)
+        except LoginThrottledError:
+            st.error("Too many failed login attempts. Please wait a moment and try again.")
         finally:
             session.close()
 
@@ -148,12 +211,11 @@ def render_registration():
         face_blob = embedding_to_blob(embedding)
 
         gov_id_path = None
-        timestamp = int(datetime.utcnow().timestamp())
+        timestamp = int(time.time())
         slug = slugify(email)
         if gov_id is not None:
-            gov_bytes = gov_id.getvalue()
             gov_id_path = ID_DIR / f"{slug}_{timestamp}_id.png"
-            save_image_bytes(gov_bytes, gov_id_path)
+            save_uploaded_file(gov_id, gov_id_path)
 
         face_path = FACE_DIR / f"{slug}_{timestamp}_face.png"
         save_image_bytes(face_bytes, face_path)
@@ -190,7 +252,7 @@ def render_admin_panel(user_snapshot: Dict):
         with st.form("create_election_form"):
             title = st.text_input("Election Title *")
             description = st.text_area("Description", height=100)
-            now = datetime.utcnow()
+            now = utcnow()
             start_date = st.date_input("Start Date *", value=now.date())
             start_time = st.time_input("Start Time *", value=now.time())
             end_default = now + timedelta(days=7)
@@ -213,16 +275,16 @@ def render_admin_panel(user_snapshot: Dict):
                         start_time=start,
                         end_time=end,
                     )
+                clear_election_caches()
                 st.success("Election created.")
 
     with admin_tabs[1]:
         st.markdown("### Add Candidates to Election")
-        with session_scope() as session:
-            elections = list_all_elections(session)
+        elections = _cached_all_elections(_election_cache_bucket())
         if not elections:
             st.info("No elections available. Create one first.")
         else:
-            election_map = {f"{e.title} ({e.id})": e.id for e in elections}
+            election_map = {f"{e['title']} ({e['id']})": e["id"] for e in elections}
             with st.form("add_candidate_form"):
                 election_label = st.selectbox("Select Election *", list(election_map.keys()))
                 candidate_name = st.text_input("Candidate Name *")
@@ -239,98 +301,92 @@ def render_admin_panel(user_snapshot: Dict):
                             name=candidate_name,
                             party=candidate_party,
                         )
+                    clear_election_caches()
                     st.success("Candidate added.")
 
     with admin_tabs[2]:
         st.markdown("### Election Results")
-        with session_scope() as session:
-            elections = list_all_elections(session)
+        elections = _cached_all_elections(_election_cache_bucket())
         if not elections:
             st.info("No elections yet.")
         else:
             election_choice = st.selectbox(
                 "Select election to view results",
                 options=elections,
-                format_func=lambda e: f"{e.title} ({e.start_time.date()} - {e.end_time.date()})",
+                format_func=lambda e: f"{e['title']} ({e['start_time'].date()} - {e['end_time'].date()})",
             )
             if election_choice:
                 with session_scope() as session:
-                    results = election_results(session, election_choice.id)
-                st.write(f"**{election_choice.title}** Results")
-                for candidate, count in results:
-                    st.metric(label=f"{candidate.name} ({candidate.party or 'Independent'})", value=count)
+                    results = election_results(session, election_choice["id"])
+                st.write(f"**{election_choice['title']}** Results")
+                for _, name, party, count in results:
+                    st.metric(label=f"{name} ({party or 'Independent'})", value=count)
 
 
 def render_voting_section(user_snapshot: Dict):
     st.subheader("Available Elections")
-    with session_scope() as session:
-        elections = list_active_elections(session, include_future=False)
-        election_payload = []
-        for election in elections:
-            candidates = [
-                {"id": candidate.id, "name": candidate.name, "party": candidate.party}
-                for candidate in election.candidates
-            ]
-            election_payload.append(
-                {
-                    "id": election.id,
-                    "title": election.title,
-                    "description": election.description,
-                    "start_time": election.start_time,
-                    "end_time": election.end_time,
-                    "candidates": candidates,
-                }
-            )
-
+    vote_notice = st.session_state.pop("vote_notice", None)
+    if vote_notice:
+        st.success(vote_notice)
+    election_payload = _cached_active_elections(_election_cache_bucket())
     if not election_payload:
         st.info("No active elections right now.")
         return
 
-    for election in election_payload:
-        st.markdown(f"### {election['title']}")
-        st.caption(
-            f"{election['description'] or ''}\n"
-            f"Open from {election['start_time']} to {election['end_time']}"
-        )
-        with session_scope() as session:
-            already_voted = has_user_voted(session, user_snapshot["id"], election["id"])
-        if already_voted:
-            st.success("You have already voted in this election.")
-            continue
-
-        if not election["candidates"]:
-            st.warning("No candidates added yet.")
-            continue
-
-        live_capture = st.camera_input(
-            "Capture live image for verification",
-            key=f"cam_{election['id']}",
-        )
-        enable_antispoof = st.checkbox(
-            "Use DeepFace anti-spoofing (slower)",
-            key=f"anti_{election['id']}",
+    with session_scope() as session:
+        voted_ids = voted_election_ids(
+            session, user_snapshot["id"], [election["id"] for election in election_payload]
         )
 
-        st.markdown("**Choose your candidate:**")
-        cols = st.columns(len(election["candidates"]))
-        for idx, candidate in enumerate(election["candidates"]):
-            with cols[idx]:
-                st.markdown(
-                    f"**{candidate['name']}**  \n"
-                    f"{candidate['party'] or 'Independent'}"
+    for election in election_payload:
+        _render_election_card(election, user_snapshot, election["id"] in voted_ids)
+
+
+@st.fragment
+def _render_election_card(election: Dict, user_snapshot: Dict, already_voted: bool):
+    # A fragment, so camera captures and vote clicks rerun only this card.
+    st.markdown(f"### {election['title']}")
+    st.caption(
+        f"{election['description'] or ''}\n"
+        f"Open from {election['start_time']} to {election['end_time']}"
+    )
+    if already_voted:
+        st.success("You have already voted in this election.")
+        return
+
+    if not election["candidates"]:
+        st.warning("No candidates added yet.")
+        return
+
+    live_capture = st.camera_input(
+        "Capture live image for verification",
+        key=f"cam_{election['id']}",
+    )
+    enable_antispoof = st.checkbox(
+        "Use DeepFace anti-spoofing (slower)",
+        key=f"anti_{election['id']}",
+    )
+
+    st.markdown("**Choose your candidate:**")
+    cols = st.columns(len(election["candidates"]))
+    for idx, candidate in enumerate(election["candidates"]):
+        with cols[idx]:
+            st.markdown(
+                f"**{candidate['name']}**  \n"
+                f"{candidate['party'] or 'Independent'}"
+            )
+            if st.button(
+                f"Vote for {candidate['name']}",
+                key=f"vote_btn_{election['id']}_{candidate['id']}",
+                use_container_width=True,
+            ):
+                process_vote_submission(
+                    user_snapshot=user_snapshot,
+                    election_id=election["id"],
+                    candidate_id=candidate["id"],
+                    live_capture=live_capture,
+                    enable_antispoof=enable_antispoof,
                 )
-                if st.button(
-                    f"Vote for {candidate['name']}",
-                    key=f"vote_btn_{election['id']}_{candidate['id']}",
-                    use_container_width=True,
-                ):
-                    process_vote_submission(
-                        user_snapshot=user_snapshot,
-                        election_id=election["id"],
-                        candidate_id=candidate["id"],
-                        live_capture=live_capture,
-                        enable_antispoof=enable_antispoof,
-                    )
 
 
 def process_vote_submission(
@@ -357,60 +413,65 @@ def process_vote_submission(
             return
         registered_embedding = blob_to_embedding(user.face_embedding)
 
-    liveness_ok, variance = perform_basic_liveness_check(live_bytes, LIVENESS_VARIANCE_THRESHOLD)
-    if not liveness_ok:
-        st.error(
-            f"Liveness verification failed (variance={variance:.2f}). "
-            "Ensure real-time capture with good lighting."
+        # Decode once; the liveness check and the embedding share this frame.
+        live_image = decode_image(live_bytes)
+        liveness_ok, variance = perform_basic_liveness_check_from_array(
+            live_image, LIVENESS_VARIANCE_THRESHOLD
         )
-        with session_scope() as session:
-            user = get_user_by_id(session, user_snapshot["id"])
+        if not liveness_ok:
+            st.error(
+                f"Liveness verification failed (variance={variance:.2f}). "
+                "Ensure real-time capture with good lighting."
+            )
             record_failed_face_attempt(session, user)
-        return
+            return
 
-    if enable_antispoof:
-        spoof_ok, spoof_msg = deepface_liveness_check(live_bytes)
-        if not spoof_ok:
-            st.error(f"DeepFace anti-spoofing failed: {spoof_msg}")
-            with session_scope() as session:
-                user = get_user_by_id(session, user_snapshot["id"])
+        if enable_antispoof:
+            spoof_ok, spoof_msg = deepface_liveness_check(live_bytes)
+            if not spoof_ok:
+                st.error(f"DeepFace anti-spoofing failed: {spoof_msg}")
                 record_failed_face_attempt(session, user)
-            return
-        st.info(spoof_msg)
+                return
+            st.info(spoof_msg)
 
-    live_embedding = generate_face_embedding(live_bytes)
-    if live_embedding is None:
-        st.error("Could not detect face in live capture. Please try again.")
-        return
+        live_embedding = generate_face_embedding(live_bytes, live_image)
+        if live_embedding is None:
+            st.error("Could not detect face in live capture. Please try again.")
+            return
 
-    match, distance = verify_face(registered_embedding, live_embedding)
-    if not match:
-        st.error(f"Face mismatch detected (distance={distance:.2f}).")
-        with session_scope() as session:
-            user = get_user_by_id(session, user_snapshot["id"])
+        match, distance = verify_face(registered_embedding, live_embedding)
+        if not match:
+            st.error(f"Face mismatch detected (distance={distance:.2f}).")
             record_failed_face_attempt(session, user)
-        return
+            return
 
-    with session_scope() as session:
-        user = get_user_by_id(session, user_snapshot["id"])
-        if has_user_voted(session, user.id, election_id):
+        # Election cards are cached and fragments rerun with the dict from the last full run;
+        # record_vote re-checks the voting window, candidate and prior vote before inserting.
+        try:
+            record_vote(
+                session,
+                voter_id=user.id,
+                election_id=election_id,
+                candidate_id=candidate_id,
+            )
+        except VotingClosedError:
+            st.error("This election is no longer open for voting.")
+            return
+        except AlreadyVotedError:
             st.warning("You have already voted in this election.")
             return
-        record_vote(
-            session,
-            voter_id=user.id,
-            election_id=election_id,
-            candidate_id=candidate_id,
-        )
         reset_failed_face_attempts(session, user)
-    st.success("Vote recorded successfully with verified face match.")
+    # Full rerun so the card shows the vote as cast and "My Votes" picks it up.
+    st.session_state["vote_notice"] = "Vote recorded successfully with verified face match."
+    st.rerun()
 
 
 def render_my_votes(user_snapshot: Dict):
     st.subheader("My Voting History")
     with session_scope() as session:
         rows = (
-            session.query(Vote, Election, Candidate)
+            session.query(Election.title, Candidate.name, Candidate.party, Vote.timestamp)
+            .select_from(Vote)
             .join(Election, Vote.election_id == Election.id)
             .join(Candidate, Vote.candidate_id == Candidate.id)
             .filter(Vote.voter_id == user_snapshot["id"])
@@ -419,12 +480,12 @@ def render_my_votes(user_snapshot: Dict):
         )
     history = [
         {
-            "election_title": election.title,
-            "candidate_name": candidate.name,
-            "candidate_party": candidate.party,
-            "timestamp": vote.timestamp,
+            "election_title": title,
+            "candidate_name": name,
+            "candidate_party": party,
+            "timestamp": timestamp,
         }
-        for vote, election, candidate in rows
+        for title, name, party, timestamp in rows
     ]
 
     if not history:
@@ -1,17 +1,31 @@
-from datetime import datetime, timedelta
-from typing import Optional
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
 
 import bcrypt
 
-from db import SessionLocal, User
+from db import SessionLocal, User, utcnow
 
 
 FAILED_FACE_LIMIT = 5
 FAILED_FACE_COOLDOWN_MIN = 5
+BCRYPT_ROUNDS = 12
+LOGIN_ATTEMPT_LIMIT = 5
+LOGIN_ATTEMPT_WINDOW_SEC = 30
+
+
+class LoginThrottledError(Exception):
+    """Too many failed logins for this email within LOGIN_ATTEMPT_WINDOW_SEC."""
+
+
+# email -> (failed attempts, window start); shared by all sessions of this server process.
+_failed_logins: Dict[str, Tuple[int, float]] = {}
+_failed_logins_lock = threading.Lock()
 
 
 def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
 
 
@@ -27,7 +41,7 @@ def get_user_by_email(session: SessionLocal, email: str) -> Optional[User]:
 
 
 def get_user_by_id(session: SessionLocal, user_id: int) -> Optional[User]:
-    return session.query(User).filter(User.id == user_id).first()
+    return session.get(User, user_id)
 
 
 def register_user(
@@ -61,22 +75,53 @@ def register_user(
     )
     session.add(user)
     session.commit()
-    session.refresh(user)
     return user
 
 
+def _is_login_throttled(email: str) -> bool:
+    email = email.strip().lower()
+    with _failed_logins_lock:
+        attempts, window_start = _failed_logins.get(email, (0, 0.0))
+    if time.monotonic() - window_start >= LOGIN_ATTEMPT_WINDOW_SEC:
+        return False
+    return attempts >= LOGIN_ATTEMPT_LIMIT
+
+
+def _record_failed_login(email: str) -> None:
+    now = time.monotonic()
+    with _failed_logins_lock:
+        attempts, window_start = _failed_logins.get(email, (0, now))
+        if now - window_start >= LOGIN_ATTEMPT_WINDOW_SEC:
+            attempts, window_start = 0, now
+        _failed_logins[email] = (attempts + 1, window_start)
+        if len(_failed_logins) > 1024:
+            for key, (_, started) in list(_failed_logins.items()):
+                if now - started >= LOGIN_ATTEMPT_WINDOW_SEC:
+                    del _failed_logins[key]
+
+
+def _clear_failed_logins(email: str) -> None:
+    with _failed_logins_lock:
+        _failed_logins.pop(email, None)
+
+
 def authenticate_user(session: SessionLocal, email: str, password: str) -> Optional[User]:
-    user = get_user_by_email(session, email.strip().lower())
-    if not user:
-        return None
-    if not verify_password(password, user.password_hash):
+    """Return the user on success, None on bad credentials; raises LoginThrottledError."""
+    email = email.strip().lower()
+    # Refuse throttled emails before bcrypt runs, so repeated guesses cost no hashing.
+    if _is_login_throttled(email):
+        raise LoginThrottledError(email)
+    user = get_user_by_email(session, email)
+    if not user or not verify_password(password, user.password_hash):
+        _record_failed_login(email)
         return None
+    _clear_failed_logins(email)
     return user
 
 
 def record_failed_face_attempt(session: SessionLocal, user: User) -> None:
     user.failed_face_attempts = (user.failed_face_attempts or 0) + 1
-    user.last_failed_face_at = datetime.utcnow()
+    user.last_failed_face_at = utcnow()
     session.add(user)
     session.commit()
 
@@ -95,5 +140,5 @@ def can_attempt_face_verification(user: User) -> bool:
     if not user.last_failed_face_at:
         return True
     cooldown = user.last_failed_face_at + timedelta(minutes=FAILED_FACE_COOLDOWN_MIN)
-    return datetime.utcnow() >= cooldown
+    return utcnow() >= cooldown
 
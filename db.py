@@ -1,5 +1,5 @@
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 from contextlib import contextmanager
 
 from sqlalchemy import (
@@ -9,19 +9,37 @@ from sqlalchemy import (
     LargeBinary,
     DateTime,
     ForeignKey,
+    Index,
     Text,
     UniqueConstraint,
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 
 
 DATABASE_URL = os.getenv("SMARTVOTE_DB_URL", "sqlite:///smartvote.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
 
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    **({} if IS_SQLITE else {"pool_size": 5, "max_overflow": 10}),
 )
+
+
+if IS_SQLITE:
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+        # WAL lets readers proceed during a write; NORMAL sync is durable enough under WAL.
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
 SessionLocal = sessionmaker(
     bind=engine,
     autoflush=False,
@@ -31,6 +49,11 @@ SessionLocal = sessionmaker(
 Base = declarative_base()
 
 
+def utcnow() -> datetime:
+    # Naive UTC, matching the existing DateTime columns; datetime.utcnow() is deprecated.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -44,7 +67,7 @@ class User(Base):
     role = Column(String(50), default="voter")
     failed_face_attempts = Column(Integer, default=0)
     last_failed_face_at = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow)
 
     votes = relationship("Vote", back_populates="voter")
 
@@ -58,6 +81,8 @@ class Election(Base):
     start_time = Column(DateTime, nullable=False)
     end_time = Column(DateTime, nullable=False)
 
+    __table_args__ = (Index("ix_election_times", "start_time", "end_time"),)
+
     candidates = relationship("Candidate", back_populates="election", cascade="all, delete-orphan")
     votes = relationship("Vote", back_populates="election", cascade="all, delete-orphan")
 
@@ -83,7 +108,7 @@ class Vote(Base):
     voter_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     election_id = Column(Integer, ForeignKey("elections.id"), nullable=False)
     candidate_id = Column(Integer, ForeignKey("candidates.id"), nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=utcnow)
 
     voter = relationship("User", back_populates="votes")
     election = relationship("Election", back_populates="votes")
@@ -91,11 +116,18 @@ class Vote(Base):
 
     __table_args__ = (
         UniqueConstraint("voter_id", "election_id", name="uq_vote_per_voter_per_election"),
+        Index("ix_vote_candidate", "candidate_id"),
+        Index("ix_vote_election", "election_id"),
     )
 
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add any indexes missing from older databases.
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
     return engine
 
 
@@ -0,0 +1,24 @@
+"""
+One-off export of the Facenet512 weights DeepFace uses to ONNX.
+
+    pip install tf2onnx onnxruntime
+    python export_onnx.py facenet512.onnx
+    SMARTVOTE_FACENET_ONNX=facenet512.onnx streamlit run app.py
+"""
+import sys
+
+import tensorflow as tf
+import tf2onnx
+
+from face_utils import get_face_model
+
+
+def export(output_path: str) -> None:
+    client = get_face_model()
+    height, width = client.input_shape
+    signature = (tf.TensorSpec((None, height, width, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(client.model, input_signature=signature, opset=17, output_path=output_path)
+
+
+if __name__ == "__main__":
+    export(sys.argv[1] if len(sys.argv) > 1 else "facenet512.onnx")
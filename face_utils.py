@@ -1,34 +1,112 @@
-import io
+import functools
+import hashlib
+import inspect
+import logging
+import math
+import os
 import pickle
+import shutil
+import struct
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import BinaryIO, Optional, Tuple
 
 import cv2
 import numpy as np
-from PIL import Image
 
 try:
     from deepface import DeepFace
 except ImportError as exc:  # pragma: no cover
     raise RuntimeError("DeepFace library is required for biometric utilities.") from exc
 
+try:
+    import onnxruntime as ort
+except ImportError:  # optional: only used when an exported Facenet512 ONNX file is configured
+    ort = None
+
+logger = logging.getLogger(__name__)
+
 
 # -------------------------------------------------------------------
 # DeepFace configuration: Use OpenCV backend ONLY (RetinaFace breaks)
 # -------------------------------------------------------------------
 DEEPFACE_MODEL = "Facenet512"
 DEEPFACE_BACKEND = "opencv"
+EMBEDDING_DIM = 512
+EMBEDDING_CACHE_SIZE = 256
+# Detection cost scales with input area; faces stay well above the detector's minimum size at this width.
+MAX_IMAGE_SIDE = 640
+# Optional ONNX export of the same Facenet512 weights (see export_onnx.py).
+FACENET_ONNX_PATH = os.getenv("SMARTVOTE_FACENET_ONNX", "")
+# Facenet512 input (height, width); used when the exported graph leaves its spatial dims symbolic.
+FACENET_INPUT_SIZE = (160, 160)
+
+
+# Cache model to avoid re-loading on Streamlit Cloud. DeepFace.represent looks the
+# model up in the same DeepFace model cache, so building it here warms that path too.
+@functools.lru_cache(maxsize=1)
+def _build_face_model():
+    return DeepFace.build_model(DEEPFACE_MODEL)
 
 
-# Cache model to avoid re-loading on Streamlit Cloud
-_face_model = None
+# lru_cache does not hold a lock while the wrapped call runs, so two cold callers on
+# Streamlit's server threads could each build the model; serialize the first build.
+_face_model_lock = threading.Lock()
 
 
 def get_face_model():
-    global _face_model
-    if _face_model is None:
-        _face_model = DeepFace.build_model(DEEPFACE_MODEL)
-    return _face_model
+    with _face_model_lock:
+        return _build_face_model()
+
+
+@functools.lru_cache(maxsize=1)
+def _deepface_preprocessing():
+    """
+    DeepFace's own detection and resize steps, which the ONNX path reuses so its embeddings stay
+    comparable with Keras ones. They live in deepface.modules, which is not public API, so check
+    the signatures we rely on and report None when this DeepFace release does not match.
+    """
+    try:
+        from deepface.modules import detection, preprocessing
+
+        extract_params = inspect.signature(detection.extract_faces).parameters
+        resize_params = inspect.signature(preprocessing.resize_image).parameters
+    except (ImportError, AttributeError, TypeError, ValueError):
+        return None
+    if not {"img_path", "detector_backend", "enforce_detection"} <= extract_params.keys():
+        return None
+    if not {"img", "target_size"} <= resize_params.keys():
+        return None
+    return detection.extract_faces, preprocessing.resize_image
+
+
+@functools.lru_cache(maxsize=1)
+def get_onnx_session():
+    if ort is None or not FACENET_ONNX_PATH or not Path(FACENET_ONNX_PATH).is_file():
+        return None
+    if _deepface_preprocessing() is None:
+        logger.warning("Installed DeepFace does not match the ONNX path; using DeepFace.represent")
+        return None
+    try:
+        return ort.InferenceSession(FACENET_ONNX_PATH, providers=["CPUExecutionProvider"])
+    except Exception:
+        logger.warning("Could not load %s; using DeepFace.represent", FACENET_ONNX_PATH, exc_info=True)
+        return None
+
+
+def warm_up_face_pipeline() -> None:
+    """
+    Build the model and push one blank frame through detection + embedding so the
+    detector load and first-inference graph setup happen at startup, not on a voter's click.
+    A failure (e.g. the weights cannot be downloaded) is logged and leaves a cold start.
+    """
+    try:
+        if get_onnx_session() is None:
+            get_face_model()
+        generate_face_embedding_from_array(np.zeros((160, 160, 3), dtype=np.uint8))
+    except Exception:
+        logger.warning("Face pipeline warm-up failed; the model will load on first use", exc_info=True)
 
 
 # ------------------------------
@@ -44,27 +122,96 @@ def save_image_bytes(image_bytes: bytes, destination: Path) -> None:
         file.write(image_bytes)
 
 
-def image_bytes_to_array(image_bytes: bytes) -> np.ndarray:
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    return np.array(image)
+def save_uploaded_file(uploaded_file: BinaryIO, destination: Path, chunk_size: int = 1 << 20) -> None:
+    # Stream in chunks rather than materialising the whole upload with getvalue().
+    ensure_dir(destination)
+    uploaded_file.seek(0)
+    with destination.open("wb") as file:
+        shutil.copyfileobj(uploaded_file, file, chunk_size)
+
+
+def decode_image(image_bytes: bytes) -> np.ndarray:
+    """Decode once to a full-resolution BGR array that both liveness and embedding can share."""
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image.")
+    return image
+
+
+def prepare_face_input(image_bgr: np.ndarray) -> np.ndarray:
+    # Keep RGB order since enrolled embeddings were computed on RGB arrays.
+    return cv2.cvtColor(limit_image_size(image_bgr), cv2.COLOR_BGR2RGB)
+
+
+def limit_image_size(image: np.ndarray, max_side: int = MAX_IMAGE_SIDE) -> np.ndarray:
+    height, width = image.shape[:2]
+    longest = max(height, width)
+    if longest <= max_side:
+        return image
+    scale = max_side / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def decode_gray(image_bytes: bytes) -> np.ndarray:
+    # Decode straight to 8-bit grayscale: no RGB buffer and no separate colour conversion pass.
+    gray = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ValueError("Could not decode image.")
+    return gray
 
 
 def normalize_embedding(embedding: np.ndarray) -> np.ndarray:
-    norm = np.linalg.norm(embedding)
-    return embedding if norm == 0 else embedding / norm
+    # A plain dot product skips np.linalg.norm's dispatch overhead on small vectors.
+    squared_norm = float(np.dot(embedding, embedding))
+    return embedding if squared_norm == 0.0 else embedding * (1.0 / math.sqrt(squared_norm))
 
 
 # -------------------------------------------------------------------
 # Face Embedding Extraction
 # -------------------------------------------------------------------
-def generate_face_embedding(image_bytes: bytes) -> Optional[np.ndarray]:
-    image_array = image_bytes_to_array(image_bytes)
+# Streamlit reruns hand us the same capture bytes again; key embeddings by a digest of them.
+_embedding_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+
+
+def generate_face_embedding(
+    image_bytes: bytes,
+    image_bgr: Optional[np.ndarray] = None,
+) -> Optional[np.ndarray]:
+    """Pass image_bgr (from decode_image) when the caller has already decoded image_bytes."""
+    key = hashlib.blake2b(image_bytes, digest_size=16).digest()
+    with _embedding_cache_lock:
+        cached = _embedding_cache.get(key)
+        if cached is not None:
+            _embedding_cache.move_to_end(key)
+            return cached
+
+    if image_bgr is None:
+        image_bgr = decode_image(image_bytes)
+    embedding = generate_face_embedding_from_array(image_bgr)
+    if embedding is None:
+        return None
+
+    embedding.setflags(write=False)
+    with _embedding_cache_lock:
+        _embedding_cache[key] = embedding
+        if len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+            _embedding_cache.popitem(last=False)
+    return embedding
+
+
+def generate_face_embedding_from_array(image_bgr: np.ndarray) -> Optional[np.ndarray]:
+    image_array = prepare_face_input(image_bgr)
+
+    onnx_session = get_onnx_session()
+    if onnx_session is not None:
+        return _onnx_face_embedding(onnx_session, image_array)
 
     try:
         reps = DeepFace.represent(
             img_path=image_array,
             model_name=DEEPFACE_MODEL,
-            model=get_face_model(),
             detector_backend=DEEPFACE_BACKEND,
             enforce_detection=False,
         )
@@ -84,18 +231,74 @@ def generate_face_embedding(image_bytes: bytes) -> Optional[np.ndarray]:
     return normalize_embedding(np.array(embedding, dtype=np.float32))
 
 
+def _onnx_face_embedding(onnx_session, image_array: np.ndarray) -> Optional[np.ndarray]:
+    # Same detection and preprocessing steps DeepFace.represent applies, so embeddings stay
+    # comparable with ones enrolled through the Keras model; only the forward pass changes.
+    # get_onnx_session only returns a session once these helpers were found.
+    extract_faces, resize_image = _deepface_preprocessing()
+
+    try:
+        faces = extract_faces(
+            img_path=image_array,
+            detector_backend=DEEPFACE_BACKEND,
+            enforce_detection=False,
+        )
+    except Exception:
+        return None
+    if not faces:
+        return None
+
+    # Read the input size off the exported graph (NHWC) instead of building the Keras model.
+    model_input = onnx_session.get_inputs()[0]
+    height, width = model_input.shape[1:3]
+    if not isinstance(height, int) or not isinstance(width, int):
+        height, width = FACENET_INPUT_SIZE
+
+    try:
+        face = resize_image(img=faces[0]["face"][:, :, ::-1], target_size=(width, height))
+        embedding = onnx_session.run(None, {model_input.name: face.astype(np.float32)})[0][0]
+    except Exception:
+        return None
+
+    return normalize_embedding(np.asarray(embedding, dtype=np.float32))
+
+
 # -------------------------------------------------------------------
 # Embedding persistence helpers
 # -------------------------------------------------------------------
+# Blob layouts, told apart by length:
+#   4 + EMBEDDING_DIM    little-endian float32 scale + int8 codes of the unit vector (current)
+#   4 * EMBEDDING_DIM    raw unit-length float32
+#   anything else        legacy pickled numpy array
+_SCALE = struct.Struct("<f")
+EMBEDDING_BLOB_SIZE = _SCALE.size + EMBEDDING_DIM
+
+
 def embedding_to_blob(embedding: Optional[np.ndarray]) -> Optional[bytes]:
-    return None if embedding is None else pickle.dumps(embedding.astype(np.float32))
+    # Quantize the L2-normalized vector to int8 with one per-vector scale: a quarter of the
+    # float32 size, and the round-trip error is far below the verification threshold.
+    if embedding is None:
+        return None
+    emb = normalize_embedding(np.asarray(embedding, dtype=np.float32))
+    peak = float(np.abs(emb).max()) if emb.size else 0.0
+    scale = peak / 127.0 if peak > 0 else 1.0
+    codes = np.round(emb / scale).astype(np.int8)
+    return _SCALE.pack(scale) + codes.tobytes()
 
 
 def blob_to_embedding(blob: Optional[bytes]) -> Optional[np.ndarray]:
     if not blob:
         return None
+    if len(blob) == EMBEDDING_BLOB_SIZE:
+        (scale,) = _SCALE.unpack_from(blob)
+        codes = np.frombuffer(blob, dtype=np.int8, offset=_SCALE.size)
+        return normalize_embedding(codes.astype(np.float32) * np.float32(scale))
+    if len(blob) == EMBEDDING_DIM * 4:
+        # Zero-copy, read-only view; the vector was normalized before it was stored.
+        return np.frombuffer(blob, dtype=np.float32)
+    # Rows enrolled before the raw format are pickled arrays.
     emb = pickle.loads(blob)
-    return normalize_embedding(emb)
+    return normalize_embedding(np.asarray(emb, dtype=np.float32))
 
 
 # -------------------------------------------------------------------
@@ -105,15 +308,22 @@ def verify_face(
     registered_embedding: Optional[np.ndarray],
     live_embedding: Optional[np.ndarray],
     threshold: float = 0.8,
+    assume_normalized: bool = True,
 ) -> Tuple[bool, float]:
     if registered_embedding is None or live_embedding is None:
         return False, float("inf")
 
-    reg = normalize_embedding(registered_embedding)
-    live = normalize_embedding(live_embedding)
-    distance = np.linalg.norm(reg - live)
+    # generate_face_embedding / blob_to_embedding already return unit vectors; only
+    # callers passing raw model output need assume_normalized=False.
+    reg = np.ascontiguousarray(registered_embedding, dtype=np.float32)
+    live = np.ascontiguousarray(live_embedding, dtype=np.float32)
+    if not assume_normalized:
+        reg = normalize_embedding(reg)
+        live = normalize_embedding(live)
+    # For unit vectors ||a - b||^2 == 2 - 2 * a.b, so one BLAS dot replaces the subtract + norm.
+    distance = float(np.sqrt(max(0.0, 2.0 - 2.0 * float(np.dot(reg, live)))))
 
-    return distance <= threshold, float(distance)
+    return distance <= threshold, distance
 
 
 # -------------------------------------------------------------------
@@ -124,10 +334,21 @@ def perform_basic_liveness_check(image_bytes: bytes, var_threshold: float = 45.0
     Simple Laplacian variance sharpness measure.
     Higher variance → more real texture → less likely spoof.
     """
-    arr = image_bytes_to_array(image_bytes)
-    gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-    variance = cv2.Laplacian(gray, cv2.CV_64F).var()
-    return variance >= var_threshold, float(variance)
+    return _laplacian_liveness(decode_gray(image_bytes), var_threshold)
+
+
+def perform_basic_liveness_check_from_array(
+    image_bgr: np.ndarray, var_threshold: float = 45.0
+) -> Tuple[bool, float]:
+    return _laplacian_liveness(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY), var_threshold)
+
+
+def _laplacian_liveness(gray: np.ndarray, var_threshold: float) -> Tuple[bool, float]:
+    # uint8 input keeps the 3x3 Laplacian within int16, so the values (and variance) match CV_64F
+    # exactly while the intermediate is a quarter of the size.
+    laplacian = cv2.Laplacian(gray, cv2.CV_16S)
+    variance = float(laplacian.var(dtype=np.float64))
+    return variance >= var_threshold, variance
 
 
 # -------------------------------------------------------------------
@@ -0,0 +1,77 @@
+"""
+One-off rewrite of legacy pickled face embeddings into the compact int8 format, so
+pickle.loads no longer runs on the verification path for those voters.
+
+    python migrate_embeddings.py
+
+Raw float32 rows are lossless and readable without pickle, so they are left as they are.
+Rows that cannot be decoded are skipped and reported.
+"""
+import logging
+import pickle
+from typing import List, Tuple
+
+from sqlalchemy import func
+
+from db import SessionLocal, User, init_db, session_scope
+from face_utils import EMBEDDING_BLOB_SIZE, EMBEDDING_DIM, blob_to_embedding, embedding_to_blob
+
+logger = logging.getLogger("migrate_embeddings")
+
+# What pickle.loads / np.asarray raise on a truncated or foreign blob.
+DECODE_ERRORS = (
+    pickle.UnpicklingError,
+    EOFError,
+    AttributeError,
+    ImportError,
+    IndexError,
+    ValueError,
+    TypeError,
+)
+
+
+def convert_legacy_blob(blob: bytes) -> bytes:
+    embedding = blob_to_embedding(blob)
+    if embedding is None or embedding.shape != (EMBEDDING_DIM,):
+        raise ValueError(f"decoded embedding has shape {getattr(embedding, 'shape', None)}")
+    return embedding_to_blob(embedding)
+
+
+def upgrade_face_embeddings(session: SessionLocal) -> Tuple[int, List[int]]:
+    """
+    Rewrite every stored embedding that is neither int8 nor raw float32.
+    Rows that fail to decode are left untouched; returns (converted count, failed user ids).
+    """
+    users = (
+        session.query(User)
+        .filter(
+            User.face_embedding.isnot(None),
+            func.length(User.face_embedding).notin_([EMBEDDING_BLOB_SIZE, EMBEDDING_DIM * 4]),
+        )
+        .all()
+    )
+    converted, failed = 0, []
+    for user in users:
+        try:
+            user.face_embedding = convert_legacy_blob(user.face_embedding)
+        except DECODE_ERRORS:
+            logger.warning("Skipping undecodable face embedding for user %s", user.id, exc_info=True)
+            failed.append(user.id)
+            continue
+        converted += 1
+    session.commit()
+    return converted, failed
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    init_db()
+    with session_scope() as session:
+        converted, failed = upgrade_face_embeddings(session)
+    logger.info("Converted %d legacy embedding(s).", converted)
+    if failed:
+        logger.info("Skipped %d undecodable embedding(s) for user id(s): %s", len(failed), failed)
+
+
+if __name__ == "__main__":
+    main()